@@ -1,11 +1,19 @@
+import numpy as np
 import pandas as pd
 import requests
+import bisect
+import threading
+import time
+import uuid
 from datetime import datetime
 import pytz
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from streamlit_autorefresh import st_autorefresh
+from procesamiento import procesar_eventos
+import metricas
 
 
 # ==============================
@@ -50,26 +58,78 @@ tz_pe = pytz.timezone("America/Lima")
 end_ts = int(datetime.now().timestamp() * 1000)
 start_ts = end_ts - 30*24*60*60*1000
 
+# Rango de NIA válidos
+NIA_MIN = 2000000000
+NIA_MAX = 2999999999
+
+# Puerto local del endpoint de métricas (formato Prometheus)
+METRICS_PORT = int(st.secrets.get("METRICS_PORT", 9464))
+
+# ==============================
+# MÉTRICAS (PROMETHEUS)
+# ==============================
+try:
+    metricas.iniciar_servidor(METRICS_PORT)
+except OSError as e:
+    st.warning(f"No se pudo iniciar el endpoint de métricas en el puerto {METRICS_PORT}: {e}")
+
+if "sesion_id" not in st.session_state:
+    st.session_state.sesion_id = uuid.uuid4().hex
+metricas.registrar_sesion(st.session_state.sesion_id)
+
+# Marca por hilo: cargar_datos() solo se ejecuta cuando la caché no tiene el dato
+estado_carga = threading.local()
+
+# ==============================
+# ALMACÉN DE EVENTOS POR SNAPSHOT
+# ==============================
+# El frame de eventos se comparte entre sesiones sin copiarlo (st.cache_data lo
+# deserializaría en cada rerun); cargar_datos() solo devuelve el reporte.
+@st.cache_resource(show_spinner=False)
+def almacen_eventos():
+    return {"lock": threading.Lock(), "snapshots": {}}
+
+
+def guardar_eventos(snapshot, df_eventos):
+    almacen = almacen_eventos()
+    with almacen["lock"]:
+        almacen["snapshots"][snapshot] = df_eventos
+        # Se conserva el snapshot anterior para sesiones que aún no recargan
+        for viejo in sorted(almacen["snapshots"])[:-2]:
+            del almacen["snapshots"][viejo]
+
+    # Solo se ejecuta con un snapshot nuevo (cache miss de cargar_datos)
+    nias = df_eventos.loc[df_eventos["NIA"].between(NIA_MIN, NIA_MAX), "NIA"].unique().tolist()
+    metricas.registrar_recorridos(set(nias))
+
+
+def obtener_eventos(snapshot):
+    return almacen_eventos()["snapshots"].get(snapshot)
+
 # ==============================
 # FUNCIÓN PARA CARGAR DATOS
 # ==============================
 @st.cache_data(show_spinner=True, ttl=500)
 def cargar_datos():
+    estado_carga.miss = True
+
     # -------- LOGIN --------
     session = requests.Session()
     session.mount("https://", requests.adapters.HTTPAdapter(max_retries=3))
     try:
-        login = session.post(
-            f"{BASE_URL}/api/auth/login",
-            json={"username": USERNAME, "password": PASSWORD},
-            timeout=15
-        )
+        with metricas.login_seg.time():
+            login = session.post(
+                f"{BASE_URL}/api/auth/login",
+                json={"username": USERNAME, "password": PASSWORD},
+                timeout=15
+            )
         login.raise_for_status()
         token = login.json()["token"]
         session.headers.update({"X-Authorization": f"Bearer {token}", "Content-Type": "application/json"})
     except requests.RequestException as e:
+        metricas.errores.labels(etapa="login").inc()
         st.error(f"Error en login: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), None
 
     # -------- TELEMETRÍA --------
     url = (
@@ -79,198 +139,251 @@ def cargar_datos():
         f"&agg=NONE&order=ASC&limit=100000"
     )
     try:
-        resp = session.get(url, timeout=30)
+        with metricas.fetch_seg.time():
+            resp = session.get(url, timeout=30)
         resp.raise_for_status()
+        metricas.fetch_bytes.inc(len(resp.content))
         data = resp.json()
+        metricas.fetch_filas.inc(sum(len(v) for v in data.values() if v))
         if not data:
             st.warning("No se encontraron eventos")
-            return pd.DataFrame()
+            return pd.DataFrame(), None
     except requests.RequestException as e:
+        metricas.errores.labels(etapa="telemetria").inc()
         st.error(f"Error al obtener telemetría: {e}")
-        return pd.DataFrame()
-
-    # -------- NORMALIZAR JSON A DATAFRAME --------
-    dfs = []
-    for key, values in data.items():
-        if not values:
-            continue
-        df_key = pd.DataFrame(values)
-        df_key.rename(columns={"value": key}, inplace=True)
-        dfs.append(df_key[["ts", key]])
-    df_all = pd.concat(dfs).groupby("ts", as_index=False).first()
-    df_all.rename(columns={"ts": "evento_ts"}, inplace=True)
-    df_all["evento_fecha"] = pd.to_datetime(df_all["evento_ts"], unit="ms", utc=True)\
-                                .dt.tz_convert("America/Lima").dt.tz_localize(None)
-
-    df = df_all.copy()
-    df["evento_ts"] = pd.to_numeric(df["evento_ts"], errors="coerce")
-    df = df.dropna(subset=["logs_nia", "evento_ts"])
-
-    # -------- RELLENAR DATOS DESASIGNACIÓN --------
-    cols_a_rellenar = [
-        "shared_tipo","shared_placaTracto","shared_placaPlataforma",
-        "shared_tracker","shared_conductor","shared_empresa"
-    ]
-    df_desasig = df[df["logs_ubicacion"]=="Desasignación"][["logs_nia"] + cols_a_rellenar]\
-                    .drop_duplicates(subset="logs_nia")
-    df = df.merge(df_desasig, on="logs_nia", how="left", suffixes=('', '_desasig'))
-    for col in cols_a_rellenar:
-        df[col] = df[col].fillna(df[f"{col}_desasig"])
-    df.drop(columns=[f"{col}_desasig" for col in cols_a_rellenar], inplace=True)
-
-    # -------- NORMALIZAR UBICACIONES --------
-    mapa_ubicaciones = {"Calificacion": "Calificación", "Iman Core": "Imán"}
-    df["logs_ubicacion"] = df["logs_ubicacion"].replace(mapa_ubicaciones)
-
-    # -------- VALIDAR RECORRIDOS COMPLETOS --------
-    def recorrido_completo(t):
-        ts_ingreso = t.loc[t["logs_ubicacion"]=="En Asignación","evento_ts"]
-        ts_salida = t.loc[t["logs_ubicacion"]=="Desasignación","evento_ts"]
-        return (not ts_ingreso.empty) and (not ts_salida.empty) and (ts_ingreso.min() < ts_salida.max())
-
-    nias_validos = df.groupby("logs_nia", sort=False).filter(recorrido_completo)["logs_nia"].unique()
-    df = df[df["logs_nia"].isin(nias_validos)]
-
-    # -------- CALCULO TIEMPOS DE PERMANENCIA --------
-    df_ing = df[df["logs_ubicacion"]=="En Asignación"].groupby("logs_nia")["evento_ts"].min()
-    df_sal = df[df["logs_ubicacion"]=="Desasignación"].groupby("logs_nia")["evento_ts"].max()
-    df_tiempos = pd.concat([df_ing, df_sal], axis=1).dropna().reset_index()
-    df_tiempos.columns = ["logs_nia","ts_ingreso","ts_salida"]
-    df_tiempos["tiempo_permanencia"] = (df_tiempos["ts_salida"] - df_tiempos["ts_ingreso"])/1000/3600
-    df_tiempos["ingreso"] = pd.to_datetime(df_tiempos["ts_ingreso"], unit="ms", utc=True).dt.tz_convert(tz_pe).dt.tz_localize(None)
-    df_tiempos["salida"] = pd.to_datetime(df_tiempos["ts_salida"], unit="ms", utc=True).dt.tz_convert(tz_pe).dt.tz_localize(None)
-
-    # -------- ORDENAR Y CALCULAR TIEMPOS ENTRE EVENTOS --------
-    df = df.sort_values(["logs_nia","evento_ts"]).assign(
-        evento_ts_siguiente=lambda x: x.groupby("logs_nia")["evento_ts"].shift(-1),
-        tiempo_min=lambda x: (x["evento_ts_siguiente"] - x["evento_ts"])/1000/60
-    )
-    df = df[df["tiempo_min"].notna() & (df["tiempo_min"]>=0)]
-
-    # -------- RENOMBRAR BALANZA Y RUTAS --------
-    df["logs_ubicacion_renombrada"] = df["logs_ubicacion"]
-    for nia, grupo in df.groupby("logs_nia"):
-        grupo = grupo.sort_values("evento_ts")
-        balanza = grupo[grupo["logs_ubicacion"]=="Balanza"]
-        if not balanza.empty:
-            balanza_ini_idx = balanza.index[0]
-            balanza_fin_idx = balanza.index[-1]
-            df.loc[balanza_ini_idx,"logs_ubicacion_renombrada"] = "Balanza inicial"
-            df.loc[balanza_fin_idx,"logs_ubicacion_renombrada"] = "Balanza final"
-            ruta_ini = grupo[grupo["evento_ts"] < grupo.loc[balanza_ini_idx,"evento_ts"]]
-            if not ruta_ini.empty and ruta_ini.iloc[-1]["logs_ubicacion"]=="Ruta hacia Balanza":
-                df.loc[ruta_ini.index[-1],"logs_ubicacion_renombrada"] = "Ruta hacia Balanza inicial"
-            ruta_fin = grupo[grupo["evento_ts"] < grupo.loc[balanza_fin_idx,"evento_ts"]]
-            if not ruta_fin.empty and ruta_fin.iloc[-1]["logs_ubicacion"]=="Ruta hacia Balanza":
-                df.loc[ruta_fin.index[-1],"logs_ubicacion_renombrada"] = "Ruta hacia Balanza final"
-
-    # -------- PIVOT FINAL Y DATOS PARA GRAFICOS --------
-    cols_shared = [
-        "logs_nia","shared_tipo","shared_placaTracto","shared_placaPlataforma",
-        "shared_tracker","shared_conductor","shared_empresa"
-    ]
-    df_shared = df[cols_shared].drop_duplicates(subset=["logs_nia"])
-    df_pivot = df.groupby(["logs_nia","logs_ubicacion_renombrada"], observed=True)["tiempo_min"].sum().reset_index()
-    df_pivot_final = df_pivot.pivot_table(
-        index="logs_nia", columns="logs_ubicacion_renombrada", values="tiempo_min", fill_value=0
-    ).reset_index()
-    df_pivot_final = df_pivot_final.merge(df_shared, on="logs_nia", how="left")
-    df_pivot_final = df_pivot_final.merge(df_tiempos, on="logs_nia", how="left")
-
-    # ======================================================
-    # TIEMPO DESCARGA
-    # ======================================================
-
-    cols_descarga = [
-        "Balanza","Balanza final","Balanza inicial","Barrido",
-        "Calificacion","Calificación","Consumo","Desasignación",
-        "Descarga","Desmanteo","Embutición","Iman Core","Imán",
-        "Oxicorte","Ruta hacia Balanza","Ruta hacia Balanza final",
-        "Ruta hacia Balanza inicial","Ruta hacia Barrido",
-        "Ruta hacia Calificacion","Ruta hacia Calificación",
-        "Ruta hacia Consumo","Ruta hacia Descarga",
-        "Ruta hacia Desmanteo","Ruta hacia Embutición",
-        "Ruta hacia Imán","Ruta hacia Oxicorte"
-    ]
+        return pd.DataFrame(), None
 
-    cols_existentes = [c for c in cols_descarga if c in df_pivot_final.columns]
-
-    df_pivot_final["tiempo_descarga"] = df_pivot_final[cols_existentes].sum(axis=1)/60
-
-    # ======================================================
-    # DataFrame final listo para graficar (simplificado)
-    # ======================================================
-    cols_base = [
-        "logs_nia","Balanza final","Balanza inicial","Barrido","Calificación","Consumo",
-        "Descarga","Desmanteo","Embutición","Imán","Oxicorte",
-        "Ruta hacia Balanza final","Ruta hacia Balanza inicial",
-        "Ruta hacia Barrido","Ruta hacia Calificación","Ruta hacia Consumo",
-        "Ruta hacia Descarga","Ruta hacia Desmanteo","Ruta hacia Embutición",
-        "Ruta hacia Imán","Ruta hacia Oxicorte",
-        "shared_tipo","shared_placaTracto","shared_placaPlataforma",
-        "shared_tracker","shared_conductor",
-        "shared_empresa",
-        "ingreso","salida","tiempo_permanencia","tiempo_descarga"
-    ]
+    # -------- PROCESAR EVENTOS --------
+    t_pipeline = time.perf_counter()
+    df_graficos, df_eventos = procesar_eventos(data)
+
+    # El snapshot identifica la descarga; sirve de clave para los cálculos derivados
+    snapshot = end_ts
 
-    rename = {
-        "logs_nia": "NIA","shared_tipo": "Tipo","shared_placaTracto": "Placa Tracto",
-        "shared_placaPlataforma": "Placa Plataforma","shared_tracker": "Tracker",
-        "shared_conductor": "Conductor","shared_empresa": "Empresa",
-        "ingreso": "Ingreso","salida": "Salida",
-        "tiempo_permanencia": "T. Permanencia (h)","tiempo_descarga": "T. Descarga (h)",
-        "Ruta hacia ": "Ruta "
-    }
-
-    df_graficos = (
-        df_pivot_final
-        .loc[:, [c for c in cols_base if c in df_pivot_final.columns]]
-        .rename(columns=lambda c: rename.get(c, c.replace("Ruta hacia ", "Ruta ")))
+    metricas.pipeline_seg.observe(time.perf_counter() - t_pipeline)
+    metricas.snapshot_ts.set(snapshot / 1000)
+
+    guardar_eventos(snapshot, df_eventos)
+
+    return df_graficos, snapshot
+
+
+# ==============================
+# TRANSICIONES ENTRE ZONAS
+# ==============================
+# Una fila por transición zona → zona siguiente (vectorizado sobre eventos ya ordenados
+# por NIA / ts). `snapshot` es la clave de caché: solo se recalcula por descarga.
+# Compartido sin copia entre sesiones; solo se lee (los filtros crean frames nuevos).
+@st.cache_resource(show_spinner=False, ttl=500, max_entries=2)
+def calcular_transiciones(_df_eventos, snapshot):
+    nia = _df_eventos["logs_nia"]
+    zona = _df_eventos["logs_ubicacion"]
+    renombrada = _df_eventos["logs_ubicacion_renombrada"]
+
+    # -------- COLAPSAR EVENTOS REPETIDOS EN LA MISMA ZONA --------
+    # Cada tramo es una secuencia consecutiva de eventos del mismo NIA en la misma zona
+    tramo = (nia.ne(nia.shift()) | zona.ne(zona.shift())).cumsum()
+
+    # Balanza / Ruta hacia Balanza sin renombrar (eventos intermedios) no dan la etiqueta
+    # del tramo si otro evento del mismo tramo ya es "inicial" o "final"
+    etiqueta = renombrada.where(
+        renombrada.ne(zona) | ~zona.isin(["Balanza", "Ruta hacia Balanza"])
     )
 
-    orden = [
-        "NIA","Tipo","Empresa","Ingreso","Salida","T. Permanencia (h)","T. Descarga (h)",
-        "Ruta Desmanteo","Desmanteo",
-        "Ruta Balanza inicial","Balanza inicial",
-        "Ruta Calificación","Calificación",
-        "Ruta Descarga","Descarga",
-        "Ruta Imán","Imán",
-        "Ruta Barrido","Barrido",
-        "Ruta Balanza final","Balanza final",
-        "Ruta Consumo","Consumo",
-        "Ruta Embutición","Embutición",
-        "Oxicorte","Ruta Oxicorte",
-        "Placa Tracto","Placa Plataforma","Tracker",
-        "Conductor"
-    ]
+    df_tramos = (
+        _df_eventos.assign(etiqueta=etiqueta)
+        .groupby(tramo, sort=False)
+        .agg(
+            logs_nia=("logs_nia", "first"),
+            NIA=("NIA", "first"),
+            Tipo=("shared_tipo", "first"),
+            zona=("logs_ubicacion", "first"),
+            Origen=("etiqueta", "first"),
+            ts_inicio=("evento_ts", "first"),
+            ts_fin=("evento_ts_siguiente", "last"),
+            siguiente=("logs_ubicacion_siguiente", "last"),
+        )
+    )
+    df_tramos["Origen"] = df_tramos["Origen"].fillna(df_tramos["zona"])
 
-    df_graficos = df_graficos.loc[:, [c for c in orden if c in df_graficos.columns]]
+    # -------- ORIGEN → DESTINO --------
+    # El último tramo de cada NIA pasa a la ubicación descartada (Desasignación)
+    mismo_nia = df_tramos["logs_nia"].eq(df_tramos["logs_nia"].shift(-1))
+    destino = df_tramos["Origen"].shift(-1).where(mismo_nia, df_tramos["siguiente"])
 
-    cols_tiempo = df_graficos.select_dtypes("number").columns
-    df_graficos[cols_tiempo] = df_graficos[cols_tiempo].round(2)
+    df_trans = pd.DataFrame({
+        "NIA": df_tramos["NIA"],
+        "Tipo": df_tramos["Tipo"],
+        "Origen": df_tramos["Origen"].str.replace("Ruta hacia ", "Ruta ", regex=False),
+        "Destino": destino.str.replace("Ruta hacia ", "Ruta ", regex=False),
+        "Minutos": (df_tramos["ts_fin"] - df_tramos["ts_inicio"])/1000/60,
+    }).reset_index(drop=True)
 
-    return df_graficos
+    return df_trans[df_trans["Destino"].notna() & df_trans["Origen"].ne(df_trans["Destino"])]
+
+# ==============================
+# ÍNDICE NIA → RANGO DE FILAS
+# ==============================
+# Los eventos de cada NIA son contiguos en el frame ordenado; se guarda (inicio, fin)
+# para cargar un recorrido con un slice, sin recorrer el resto de la ventana.
+@st.cache_resource(show_spinner=False, ttl=500, max_entries=2)
+def indexar_eventos_por_nia(_df_eventos, snapshot):
+    nia = _df_eventos["logs_nia"].to_numpy()
+    cortes = np.flatnonzero(nia[1:] != nia[:-1]) + 1
+    inicio = np.r_[0, cortes]
+    fin = np.r_[cortes, len(nia)]
+    claves = _df_eventos["NIA"].to_numpy()[inicio].tolist()
+    return dict(zip(claves, zip(inicio.tolist(), fin.tolist())))
+
+
+# ==============================
+# ÍNDICE DE BÚSQUEDA (NIA, PLACAS, TRACKER, CONDUCTOR)
+# ==============================
+# Índice invertido término → NIA con lista ordenada de términos para búsqueda por
+# prefijo. Se comparte entre sesiones y se actualiza solo con los NIA que cambian.
+class IndiceBusqueda:
+    campos = ["NIA", "Placa Tracto", "Placa Plataforma", "Tracker", "Conductor"]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.terminos_nia = {}   # NIA → tupla de términos indexados
+        self.postings = {}       # término → set de NIA
+        self.terminos = []       # términos ordenados (prefijos con bisect)
+
+    @staticmethod
+    def normalizar(texto):
+        return " ".join(str(texto).upper().replace("-", " ").split())
+
+    def _terminos_fila(self, valores):
+        terminos = set()
+        for valor in valores:
+            if valor:
+                terminos.add(valor)
+                terminos.update(valor.split())
+        return tuple(sorted(terminos))
+
+    def _agregar(self, nia, terminos, nuevos):
+        self.terminos_nia[nia] = terminos
+        for t in terminos:
+            if t not in self.postings:
+                self.postings[t] = set()
+                nuevos.append(t)
+            self.postings[t].add(nia)
+
+    def _quitar(self, nia, quitados):
+        for t in self.terminos_nia.pop(nia, ()):
+            nias = self.postings[t]
+            nias.discard(nia)
+            if not nias:
+                del self.postings[t]
+                quitados.append(t)
+
+    def actualizar(self, df, snapshot):
+        with self.lock:
+            if snapshot == self.snapshot:
+                return
+
+            # Valores normalizados por campo (vectorizado), luego una tupla por NIA
+            cols = [
+                df[c].map(lambda v: f"{v:.0f}", na_action="ignore").fillna("") if c == "NIA"
+                else df[c].fillna("").astype(str).map(self.normalizar)
+                for c in self.campos
+            ]
+            actuales = {
+                nia: self._terminos_fila(valores)
+                for nia, *valores in zip(df["NIA"].tolist(), *[c.tolist() for c in cols])
+            }
+
+            nuevos, quitados = [], []
+            for nia in self.terminos_nia.keys() - actuales.keys():
+                self._quitar(nia, quitados)
+            for nia, terminos in actuales.items():
+                previos = self.terminos_nia.get(nia)
+                if previos == terminos:
+                    continue
+                if previos is not None:
+                    self._quitar(nia, quitados)
+                self._agregar(nia, terminos, nuevos)
+
+            # Pocos cambios: inserción ordenada; muchos: se reordena una sola vez
+            if len(nuevos) + len(quitados) > 1000:
+                self.terminos = sorted(self.postings)
+            else:
+                for t in quitados:
+                    if t not in self.postings:
+                        i = bisect.bisect_left(self.terminos, t)
+                        if i < len(self.terminos) and self.terminos[i] == t:
+                            del self.terminos[i]
+                for t in nuevos:
+                    if t in self.postings:
+                        i = bisect.bisect_left(self.terminos, t)
+                        if i == len(self.terminos) or self.terminos[i] != t:
+                            self.terminos.insert(i, t)
+
+            self.snapshot = snapshot
+
+    def buscar(self, texto):
+        # Cada palabra de la consulta es un prefijo; el resultado es la intersección
+        resultado = None
+        with self.lock:
+            for palabra in self.normalizar(texto).split():
+                nias = set()
+                i = bisect.bisect_left(self.terminos, palabra)
+                while i < len(self.terminos) and self.terminos[i].startswith(palabra):
+                    nias |= self.postings[self.terminos[i]]
+                    i += 1
+                resultado = nias if resultado is None else resultado & nias
+                if not resultado:
+                    break
+        return resultado or set()
+
+
+@st.cache_resource(show_spinner=False)
+def obtener_indice_busqueda():
+    return IndiceBusqueda()
+
+
+# Recorridos del snapshot indexados por NIA: los resultados se toman con .loc sobre las
+# claves encontradas, sin recorrer la tabla en cada consulta.
+@st.cache_resource(show_spinner=False, ttl=500, max_entries=2)
+def recorridos_por_nia(_df_snapshot, snapshot):
+    return _df_snapshot.set_index("NIA", drop=False)
 
 # ==============================
 # CARGAR DATOS Y FILTRAR NIA
 # ==============================
-df_graficos = cargar_datos()
+estado_carga.miss = False
+df_graficos, snapshot = cargar_datos()
+metricas.cache.labels(resultado="miss" if estado_carga.miss else "hit").inc()
+if snapshot is not None:
+    metricas.estado["snapshot"] = snapshot
 
 if df_graficos.empty:
     st.stop()
 
-# Filtrar NIA válidos: numéricos, rango 2000000000 - 2999999999
+# Eventos del snapshot (sin copia); si el almacén se vació, se fuerza una nueva descarga
+df_eventos = obtener_eventos(snapshot)
+if df_eventos is None:
+    cargar_datos.clear()
+    st.rerun()
+
+# Filtrar NIA válidos: numéricos, rango NIA_MIN - NIA_MAX
 df_graficos["NIA"] = pd.to_numeric(df_graficos["NIA"], errors='coerce')
 df_graficos = df_graficos[
     df_graficos["NIA"].notna() & 
-    (df_graficos["NIA"] >= 2000000000) & 
-    (df_graficos["NIA"] <= 2999999999)
+    (df_graficos["NIA"] >= NIA_MIN) & 
+    (df_graficos["NIA"] <= NIA_MAX)
 ]
 
 if df_graficos.empty:
     st.warning("No hay NIA válidos dentro del rango especificado.")
     st.stop()
 
+# Índice de búsqueda sobre todos los recorridos del snapshot (solo cambia por descarga)
+indice_busqueda = obtener_indice_busqueda()
+indice_busqueda.actualizar(df_graficos, snapshot)
+
 # Filtrar columnas de tiempo
 cols_tiempos = [c for c in df_graficos.columns if c not in [
     "NIA","Tipo","Placa Tracto","Placa Plataforma","Tracker",
@@ -300,6 +413,8 @@ if st.sidebar.button("Tiempos promedio de zona"):
     cambiar_pagina("Tiempos promedio de zona")
 if st.sidebar.button("Detalle Zonas"):
     cambiar_pagina("Detalle Zonas")
+if st.sidebar.button("Transiciones"):
+    cambiar_pagina("Transiciones")
 
 tz_pe = pytz.timezone("America/Lima")
 
@@ -358,6 +473,9 @@ else:
 inicio_turno_anterior = inicio_turno_actual - timedelta(hours=12)
 fin_turno_anterior = inicio_turno_actual
 
+# Recorridos del snapshot completo (la búsqueda no depende del filtro)
+df_snapshot = df_graficos
+
 # --------------------------------------------------
 # Aplicar filtro único
 # --------------------------------------------------
@@ -391,13 +509,14 @@ elif filtro_opcion == "Último mes":
 # --------------------------------------------------
 # Validación final
 # --------------------------------------------------
-if df_graficos.empty:
+# Recorridos sigue disponible: su búsqueda cubre todo el snapshot
+pagina = st.session_state.pagina
+if df_graficos.empty and pagina != "Recorridos":
     st.warning("No hay datos para el filtro seleccionado.")
     st.stop()
 # ==============================
 # PÁGINA: Dashboard
 # ==============================
-pagina = st.session_state.pagina
 if pagina == "Reporte":
     st.title("Reporte de Recorridos")
     st.metric("Total NIA", len(df_graficos["NIA"].unique()))
@@ -409,8 +528,21 @@ if pagina == "Reporte":
 elif pagina == "Recorridos":
     st.subheader("Tabla completa de recorridos")
 
+    busqueda = st.text_input("Buscar por NIA, placa, tracker o conductor")
+
+    if busqueda.strip():
+        # Búsqueda en todo el snapshot, sin recorrer filas por cada consulta
+        df_por_nia = recorridos_por_nia(df_snapshot, snapshot)
+        nias_encontrados = [n for n in indice_busqueda.buscar(busqueda) if n in df_por_nia.index]
+        df_base = df_por_nia.loc[nias_encontrados].reset_index(drop=True)
+        st.caption(f"{len(df_base)} recorridos encontrados (todas las fechas)")
+    else:
+        df_base = df_graficos
+        if df_base.empty:
+            st.warning("No hay datos para el filtro seleccionado.")
+
     df_tabla = (
-        df_graficos
+        df_base
         .sort_values("Salida", ascending=False)
         .reset_index(drop=True)
     )
@@ -748,9 +880,131 @@ elif pagina == "Detalle Zonas":
 
         st.plotly_chart(fig, width='stretch')
 
+        # --------------------------------------------------
+        # 9️⃣ LÍNEA DE TIEMPO DEL RECORRIDO (NIA)
+        # --------------------------------------------------
+        st.subheader("Línea de tiempo por NIA")
+
+        if nias_filtradas.empty:
+            st.info("No hay NIA para mostrar su recorrido.")
+        else:
+            selected_nia = st.selectbox(
+                "Seleccione NIA",
+                nias_filtradas["NIA"].tolist(),
+                format_func=lambda n: f"{n:.0f}"
+            )
+
+            # Solo se leen las filas del NIA seleccionado
+            indice_nia = indexar_eventos_por_nia(df_eventos, snapshot)
+            ini, fin = indice_nia.get(selected_nia, (0, 0))
+            df_viaje = df_eventos.iloc[ini:fin]
+
+            if df_viaje.empty:
+                st.warning(f"No hay eventos para el NIA **{selected_nia:.0f}**")
+            else:
+                df_viaje = pd.DataFrame({
+                    "Ubicación": df_viaje["logs_ubicacion_renombrada"].str.replace("Ruta hacia ", "Ruta ", regex=False),
+                    "Inicio": df_viaje["evento_fecha"],
+                    "Fin": df_viaje["evento_fecha"] + pd.to_timedelta(df_viaje["tiempo_min"], unit="min"),
+                    "Tiempo (min)": df_viaje["tiempo_min"].round(2)
+                })
+
+                fig_viaje = px.timeline(
+                    df_viaje,
+                    x_start="Inicio",
+                    x_end="Fin",
+                    y="Ubicación",
+                    color="Ubicación",
+                    hover_data={"Tiempo (min)": True}
+                )
+                fig_viaje.update_yaxes(
+                    categoryorder="array",
+                    categoryarray=df_viaje["Ubicación"].unique().tolist(),
+                    autorange="reversed"
+                )
+                fig_viaje.update_layout(
+                    title=f"Recorrido NIA {selected_nia:.0f}",
+                    xaxis_title="Hora",
+                    yaxis_title="Ubicación",
+                    showlegend=False
+                )
+
+                st.plotly_chart(fig_viaje, width='stretch')
+
     else:
         st.info("No hay columnas de tiempo disponibles para graficar.")
 
+# ==============================
+# PÁGINA: Transiciones entre zonas
+# ==============================
+elif pagina == "Transiciones":
+    st.subheader("Transiciones entre zonas")
+
+    # Solo los recorridos que quedan dentro del filtro de fecha / turno
+    df_trans = calcular_transiciones(df_eventos, snapshot)
+    df_trans = df_trans[df_trans["NIA"].isin(df_graficos["NIA"])]
+
+    tipos_disponibles = df_trans["Tipo"].dropna().unique().tolist()
+
+    if not tipos_disponibles:
+        st.info("No hay transiciones para el filtro seleccionado.")
+    else:
+        selected_tipo = st.selectbox("Seleccione tipo", tipos_disponibles)
+
+        # ============================
+        # CONTEO Y MEDIANA POR TRANSICIÓN
+        # ============================
+        df_flujo = (
+            df_trans[df_trans["Tipo"] == selected_tipo]
+            .groupby(["Origen", "Destino"], sort=False)["Minutos"]
+            .agg(Conteo="size", Mediana="median")
+            .reset_index()
+            .sort_values("Conteo", ascending=False)
+        )
+
+        # ============================
+        # SANKEY
+        # ============================
+        nodos = list(dict.fromkeys(df_flujo["Origen"].tolist() + df_flujo["Destino"].tolist()))
+        idx_nodo = {n: i for i, n in enumerate(nodos)}
+
+        fig_sankey = go.Figure(go.Sankey(
+            node=dict(label=nodos, pad=15, thickness=18),
+            link=dict(
+                source=df_flujo["Origen"].map(idx_nodo),
+                target=df_flujo["Destino"].map(idx_nodo),
+                value=df_flujo["Conteo"],
+                customdata=df_flujo["Mediana"].round(1),
+                hovertemplate="%{source.label} → %{target.label}<br>"
+                              "Transiciones: %{value}<br>"
+                              "Mediana: %{customdata} min<extra></extra>"
+            )
+        ))
+        fig_sankey.update_layout(margin=dict(l=20, r=20, t=20, b=20), height=600)
+
+        st.plotly_chart(fig_sankey, width='stretch')
+
+        # ============================
+        # MATRIZ DE TRANSICIÓN
+        # ============================
+        st.markdown("#### Matriz de transición (conteo)")
+        st.dataframe(
+            df_flujo.pivot(index="Origen", columns="Destino", values="Conteo")
+            .reindex(index=[n for n in nodos if n in set(df_flujo["Origen"])])
+            .fillna(0)
+            .astype(int),
+            width="stretch"
+        )
+
+        st.markdown("#### Detalle de transiciones")
+        st.dataframe(
+            df_flujo
+            .assign(Mediana=df_flujo["Mediana"].round(2))
+            .rename(columns={"Mediana": "Mediana (min)"})
+            .reset_index(drop=True),
+            width="stretch"
+        )
+
 
 
 
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+
+
+# ==============================
+# MÉTRICAS (PROMETHEUS)
+# ==============================
+# Registro y servidor únicos por proceso. Viven en un módulo importado (no en el script
+# ni en st.cache_resource): los reruns y el "Clear cache" de Streamlit no lo vuelven a
+# ejecutar, así que el endpoint siempre sirve el mismo registro que se actualiza.
+registro = CollectorRegistry()
+estado = {"snapshot": None, "sesiones": {}, "servidor": False, "nias": None}
+_lock = threading.Lock()
+
+login_seg = Histogram("st_report_login_seconds", "Latencia del login en ThingsBoard", registry=registro)
+fetch_seg = Histogram(
+    "st_report_fetch_seconds", "Latencia de la descarga de telemetría",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60), registry=registro
+)
+fetch_bytes = Counter("st_report_fetch_bytes", "Bytes de telemetría descargados", registry=registro)
+fetch_filas = Counter("st_report_fetch_rows", "Valores de telemetría descargados", registry=registro)
+errores = Counter("st_report_fetch_errors", "Errores al consultar ThingsBoard", ["etapa"], registry=registro)
+cache = Counter("st_report_data_cache", "Llamadas a cargar_datos() por resultado de caché", ["resultado"], registry=registro)
+pipeline_seg = Histogram(
+    "st_report_pipeline_seconds", "Duración del procesamiento de eventos a reporte",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30), registry=registro
+)
+recorridos_cerrados = Counter(
+    "st_report_trips_closed", "Recorridos cerrados nuevos (NIA válido) detectados por snapshot", registry=registro
+)
+recorridos_ventana = Gauge(
+    "st_report_trips_in_window", "Recorridos cerrados con NIA válido en la ventana de 30 días", registry=registro
+)
+snapshot_ts = Gauge("st_report_snapshot_timestamp_seconds", "Hora de la última descarga", registry=registro)
+snapshot_edad = Gauge("st_report_snapshot_age_seconds", "Antigüedad del snapshot en uso", registry=registro)
+sesiones = Gauge("st_report_active_sessions", "Sesiones activas del dashboard", registry=registro)
+
+
+def _edad_snapshot():
+    return time.time() - estado["snapshot"] / 1000 if estado["snapshot"] else float("nan")
+
+
+def _sesiones_activas():
+    # Una sesión sigue activa si hizo un rerun en los últimos 2 ciclos de autorefresh
+    limite = time.time() - 2 * 60
+    with _lock:
+        for sid in [s for s, visto in estado["sesiones"].items() if visto < limite]:
+            del estado["sesiones"][sid]
+        return len(estado["sesiones"])
+
+
+snapshot_edad.set_function(_edad_snapshot)
+sesiones.set_function(_sesiones_activas)
+
+
+def iniciar_servidor(puerto):
+    # Un solo intento por proceso; un OSError (puerto ocupado) se propaga una vez
+    with _lock:
+        if estado["servidor"]:
+            return
+        estado["servidor"] = True
+    start_http_server(puerto, registry=registro)
+
+
+def registrar_recorridos(nias):
+    # Se llama una vez por snapshot nuevo: suma los NIA que no estaban en el anterior.
+    # El primer snapshot del proceso solo fija la base (no son cierres recientes).
+    with _lock:
+        previos = estado["nias"]
+        estado["nias"] = nias
+    recorridos_ventana.set(len(nias))
+    if previos is not None:
+        recorridos_cerrados.inc(len(nias - previos))
+
+
+def registrar_sesion(sesion_id):
+    with _lock:
+        estado["sesiones"][sesion_id] = time.time()
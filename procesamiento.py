@@ -0,0 +1,184 @@
+import pandas as pd
+import pytz
+
+
+tz_pe = pytz.timezone("America/Lima")
+
+# Pico de memoria admitido en procesar_eventos(), como múltiplo del tamaño de la
+# telemetría recibida (ver tests/test_memoria.py)
+MEMORIA_MAX_FACTOR = 0.6
+
+
+# ==============================
+# PROCESAR TELEMETRÍA → REPORTE
+# ==============================
+# Recibe el JSON de ThingsBoard ({key: [{"ts", "value"}, ...]}) y devuelve el reporte
+# por NIA (una fila por recorrido) y los eventos ordenados por NIA / ts.
+def procesar_eventos(data):
+    # -------- NORMALIZAR JSON A DATAFRAME --------
+    # Una serie por key indexada por ts y alineadas por índice: evita el concat disperso
+    # (todas las keys × todas las filas) y el groupby sobre ese frame
+    columnas = {}
+    for key, values in data.items():
+        if not values:
+            continue
+        serie = pd.Series([v["value"] for v in values], index=[v["ts"] for v in values])
+        columnas[key] = serie.groupby(level=0).first()
+    df = pd.concat(columnas, axis=1).rename_axis("evento_ts").reset_index()
+    del columnas
+    df["evento_fecha"] = pd.to_datetime(df["evento_ts"], unit="ms", utc=True)\
+                            .dt.tz_convert("America/Lima").dt.tz_localize(None)
+
+    df["evento_ts"] = pd.to_numeric(df["evento_ts"], errors="coerce")
+    df.dropna(subset=["logs_nia", "evento_ts"], inplace=True)
+
+    # -------- RELLENAR DATOS DESASIGNACIÓN --------
+    cols_a_rellenar = [
+        "shared_tipo","shared_placaTracto","shared_placaPlataforma",
+        "shared_tracker","shared_conductor","shared_empresa"
+    ]
+    # Una fila por NIA; se rellena por columna con map, sin merge del frame completo
+    df_desasig = df.loc[df["logs_ubicacion"]=="Desasignación", ["logs_nia"] + cols_a_rellenar]\
+                    .drop_duplicates(subset="logs_nia").set_index("logs_nia")
+    for col in cols_a_rellenar:
+        df[col] = df[col].fillna(df["logs_nia"].map(df_desasig[col]))
+    del df_desasig
+
+    # -------- NORMALIZAR UBICACIONES --------
+    mapa_ubicaciones = {"Calificacion": "Calificación", "Iman Core": "Imán"}
+    df["logs_ubicacion"] = df["logs_ubicacion"].replace(mapa_ubicaciones)
+
+    # -------- VALIDAR RECORRIDOS COMPLETOS --------
+    def recorrido_completo(t):
+        ts_ingreso = t.loc[t["logs_ubicacion"]=="En Asignación","evento_ts"]
+        ts_salida = t.loc[t["logs_ubicacion"]=="Desasignación","evento_ts"]
+        return (not ts_ingreso.empty) and (not ts_salida.empty) and (ts_ingreso.min() < ts_salida.max())
+
+    nias_validos = df.groupby("logs_nia", sort=False).filter(recorrido_completo)["logs_nia"].unique()
+    df = df[df["logs_nia"].isin(nias_validos)]
+
+    # -------- CALCULO TIEMPOS DE PERMANENCIA --------
+    df_ing = df[df["logs_ubicacion"]=="En Asignación"].groupby("logs_nia")["evento_ts"].min()
+    df_sal = df[df["logs_ubicacion"]=="Desasignación"].groupby("logs_nia")["evento_ts"].max()
+    df_tiempos = pd.concat([df_ing, df_sal], axis=1).dropna().reset_index()
+    df_tiempos.columns = ["logs_nia","ts_ingreso","ts_salida"]
+    df_tiempos["tiempo_permanencia"] = (df_tiempos["ts_salida"] - df_tiempos["ts_ingreso"])/1000/3600
+    df_tiempos["ingreso"] = pd.to_datetime(df_tiempos["ts_ingreso"], unit="ms", utc=True).dt.tz_convert(tz_pe).dt.tz_localize(None)
+    df_tiempos["salida"] = pd.to_datetime(df_tiempos["ts_salida"], unit="ms", utc=True).dt.tz_convert(tz_pe).dt.tz_localize(None)
+
+    # -------- ORDENAR Y CALCULAR TIEMPOS ENTRE EVENTOS --------
+    df = df.sort_values(["logs_nia","evento_ts"]).assign(
+        evento_ts_siguiente=lambda x: x.groupby("logs_nia")["evento_ts"].shift(-1),
+        logs_ubicacion_siguiente=lambda x: x.groupby("logs_nia")["logs_ubicacion"].shift(-1),
+        tiempo_min=lambda x: (x["evento_ts_siguiente"] - x["evento_ts"])/1000/60
+    )
+    df = df[df["tiempo_min"].notna() & (df["tiempo_min"]>=0)]
+
+    # -------- RENOMBRAR BALANZA Y RUTAS --------
+    df["logs_ubicacion_renombrada"] = df["logs_ubicacion"]
+    for nia, grupo in df.groupby("logs_nia"):
+        grupo = grupo.sort_values("evento_ts")
+        balanza = grupo[grupo["logs_ubicacion"]=="Balanza"]
+        if not balanza.empty:
+            balanza_ini_idx = balanza.index[0]
+            balanza_fin_idx = balanza.index[-1]
+            df.loc[balanza_ini_idx,"logs_ubicacion_renombrada"] = "Balanza inicial"
+            df.loc[balanza_fin_idx,"logs_ubicacion_renombrada"] = "Balanza final"
+            ruta_ini = grupo[grupo["evento_ts"] < grupo.loc[balanza_ini_idx,"evento_ts"]]
+            if not ruta_ini.empty and ruta_ini.iloc[-1]["logs_ubicacion"]=="Ruta hacia Balanza":
+                df.loc[ruta_ini.index[-1],"logs_ubicacion_renombrada"] = "Ruta hacia Balanza inicial"
+            ruta_fin = grupo[grupo["evento_ts"] < grupo.loc[balanza_fin_idx,"evento_ts"]]
+            if not ruta_fin.empty and ruta_fin.iloc[-1]["logs_ubicacion"]=="Ruta hacia Balanza":
+                df.loc[ruta_fin.index[-1],"logs_ubicacion_renombrada"] = "Ruta hacia Balanza final"
+
+    # -------- DATOS COMPARTIDOS POR NIA --------
+    cols_shared = [
+        "logs_nia","shared_tipo","shared_placaTracto","shared_placaPlataforma",
+        "shared_tracker","shared_conductor","shared_empresa"
+    ]
+    df_shared = df[cols_shared].drop_duplicates(subset=["logs_nia"]).set_index("logs_nia")
+
+    # Un solo Tipo por recorrido en los eventos: el mismo que muestra el reporte
+    df["shared_tipo"] = df["logs_nia"].map(df_shared["shared_tipo"])
+
+    # -------- EVENTOS ORDENADOS (NIA / TS) --------
+    # Se reutiliza el mismo frame: solo se descartan columnas, sin copiarlo
+    cols_eventos = [
+        "logs_nia","evento_ts","evento_fecha","logs_ubicacion","logs_ubicacion_renombrada",
+        "logs_ubicacion_siguiente","evento_ts_siguiente","tiempo_min","shared_tipo"
+    ]
+    df.drop(columns=[c for c in df.columns if c not in cols_eventos], inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    df["NIA"] = pd.to_numeric(df["logs_nia"], errors="coerce")
+    df_eventos = df
+
+    # -------- PIVOT FINAL (UNA SOLA AGREGACIÓN) --------
+    df_graficos = df_eventos.pivot_table(
+        index="logs_nia", columns="logs_ubicacion_renombrada", values="tiempo_min",
+        aggfunc="sum", fill_value=0
+    )
+
+    # ======================================================
+    # TIEMPO DESCARGA
+    # ======================================================
+
+    cols_descarga = [
+        "Balanza","Balanza final","Balanza inicial","Barrido",
+        "Calificacion","Calificación","Consumo","Desasignación",
+        "Descarga","Desmanteo","Embutición","Iman Core","Imán",
+        "Oxicorte","Ruta hacia Balanza","Ruta hacia Balanza final",
+        "Ruta hacia Balanza inicial","Ruta hacia Barrido",
+        "Ruta hacia Calificacion","Ruta hacia Calificación",
+        "Ruta hacia Consumo","Ruta hacia Descarga",
+        "Ruta hacia Desmanteo","Ruta hacia Embutición",
+        "Ruta hacia Imán","Ruta hacia Oxicorte"
+    ]
+
+    cols_existentes = [c for c in cols_descarga if c in df_graficos.columns]
+
+    tiempo_descarga = df_graficos[cols_existentes].sum(axis=1)/60
+
+    # ======================================================
+    # DataFrame final listo para graficar (simplificado)
+    # ======================================================
+    # Columnas añadidas sobre el pivot, alineadas por índice NIA (sin merges)
+    df_graficos.columns = [c.replace("Ruta hacia ", "Ruta ") for c in df_graficos.columns]
+    df_tiempos.set_index("logs_nia", inplace=True)
+
+    rename = {
+        "shared_tipo": "Tipo","shared_placaTracto": "Placa Tracto",
+        "shared_placaPlataforma": "Placa Plataforma","shared_tracker": "Tracker",
+        "shared_conductor": "Conductor","shared_empresa": "Empresa"
+    }
+    for col, nombre in rename.items():
+        df_graficos[nombre] = df_shared[col]
+    df_graficos["Ingreso"] = df_tiempos["ingreso"]
+    df_graficos["Salida"] = df_tiempos["salida"]
+    df_graficos["T. Permanencia (h)"] = df_tiempos["tiempo_permanencia"]
+    df_graficos["T. Descarga (h)"] = tiempo_descarga
+
+    df_graficos.index.name = "NIA"
+    df_graficos.reset_index(inplace=True)
+
+    orden = [
+        "NIA","Tipo","Empresa","Ingreso","Salida","T. Permanencia (h)","T. Descarga (h)",
+        "Ruta Desmanteo","Desmanteo",
+        "Ruta Balanza inicial","Balanza inicial",
+        "Ruta Calificación","Calificación",
+        "Ruta Descarga","Descarga",
+        "Ruta Imán","Imán",
+        "Ruta Barrido","Barrido",
+        "Ruta Balanza final","Balanza final",
+        "Ruta Consumo","Consumo",
+        "Ruta Embutición","Embutición",
+        "Oxicorte","Ruta Oxicorte",
+        "Placa Tracto","Placa Plataforma","Tracker",
+        "Conductor"
+    ]
+
+    df_graficos = df_graficos.loc[:, [c for c in orden if c in df_graficos.columns]]
+
+    cols_tiempo = df_graficos.select_dtypes("number").columns
+    df_graficos[cols_tiempo] = df_graficos[cols_tiempo].round(2)
+
+    return df_graficos, df_eventos
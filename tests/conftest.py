@@ -0,0 +1,3 @@
+def pytest_configure(config):
+    # Tests costosos; se omiten con: python -m pytest -m "not slow"
+    config.addinivalue_line("markers", "slow: test lento (mes sintético bajo tracemalloc)")
@@ -0,0 +1,72 @@
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from procesamiento import MEMORIA_MAX_FACTOR, procesar_eventos
+
+
+# Secuencia típica de un recorrido (con eventos repetidos en Balanza y Calificación)
+ZONAS = [
+    "En Asignación", "Ruta hacia Desmanteo", "Desmanteo",
+    "Ruta hacia Balanza", "Balanza", "Balanza",
+    "Ruta hacia Calificacion", "Calificacion", "Calificacion",
+    "Ruta hacia Descarga", "Descarga", "Iman Core",
+    "Ruta hacia Balanza", "Balanza", "Desasignación"
+]
+SHARED = {
+    "shared_tipo": ["Plataforma", "Tolva"],
+    "shared_placaTracto": ["ABC-123", "XYZ-987", "DEF-456"],
+    "shared_placaPlataforma": ["P1-001", "P2-002"],
+    "shared_tracker": ["TRK-01", "TRK-02", "TRK-03"],
+    "shared_conductor": ["JUAN PEREZ", "ANA TORRES", "LUIS RAMOS"],
+    "shared_empresa": ["Empresa A", "Empresa B"],
+}
+
+
+def telemetria_mes(recorridos_por_dia=80, dias=30, seed=0):
+    # Mismo formato que /values/timeseries de ThingsBoard: {key: [{"ts", "value"}]}
+    rnd = random.Random(seed)
+    data = {k: [] for k in ["logs_nia", "logs_ubicacion", *SHARED]}
+    inicio = 1_700_000_000_000
+    total = recorridos_por_dia * dias
+    for k in range(total):
+        # Minutos crecientes por recorrido; el resto en ms (k) hace únicos los ts entre recorridos
+        minuto = k * dias * 24 * 60 // total
+        nia = str(2000000000 + k)
+        for i, zona in enumerate(ZONAS):
+            minuto += rnd.randint(1, 30)
+            ts = inicio + minuto * 60000 + k
+            data["logs_nia"].append({"ts": ts, "value": nia})
+            data["logs_ubicacion"].append({"ts": ts, "value": zona})
+            # Datos compartidos solo al asignar y desasignar (el resto se rellena por NIA)
+            if i in (0, len(ZONAS) - 1):
+                for key, valores in SHARED.items():
+                    data[key].append({"ts": ts, "value": rnd.choice(valores)})
+    return data
+
+
+# ~45 s: el mes sintético (2400 recorridos) se procesa bajo tracemalloc
+@pytest.mark.slow
+def test_pico_memoria_dentro_del_presupuesto():
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.get_traced_memory()[0]
+        data = telemetria_mes()
+        entrada = tracemalloc.get_traced_memory()[0] - antes
+
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        df_graficos, df_eventos = procesar_eventos(data)
+        pico = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+    assert len(df_graficos) == 80 * 30
+    assert pico <= MEMORIA_MAX_FACTOR * entrada, (
+        f"pico {pico / 2**20:.1f} MiB > {MEMORIA_MAX_FACTOR} x entrada {entrada / 2**20:.1f} MiB"
+    )
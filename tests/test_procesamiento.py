@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from procesamiento import procesar_eventos
+
+
+INICIO = 1_700_000_000_000  # 2023-11-14 17:13:20 en Lima
+
+
+def telemetria(eventos, shared):
+    # eventos: [(nia, minuto, ubicación)]; shared: {(nia, minuto): {key: valor}}
+    data = {"logs_nia": [], "logs_ubicacion": []}
+    for nia, minuto, ubicacion in eventos:
+        ts = INICIO + minuto * 60000
+        data["logs_nia"].append({"ts": ts, "value": nia})
+        data["logs_ubicacion"].append({"ts": ts, "value": ubicacion})
+        for key, valor in shared.get((nia, minuto), {}).items():
+            data.setdefault(key, []).append({"ts": ts, "value": valor})
+    return data
+
+
+def test_recorrido_con_datos_solo_en_desasignacion():
+    eventos = [
+        ("2000000001", 0, "En Asignación"),
+        ("2000000001", 10, "Ruta hacia Balanza"),
+        ("2000000001", 15, "Balanza"),
+        ("2000000001", 20, "Balanza"),
+        ("2000000001", 30, "Calificacion"),
+        ("2000000001", 50, "Ruta hacia Balanza"),
+        ("2000000001", 55, "Balanza"),
+        ("2000000001", 60, "Desasignación"),
+        # Recorrido sin Desasignación: no se reporta
+        ("2000000002", 5, "En Asignación"),
+        ("2000000002", 25, "Calificacion"),
+    ]
+    shared = {
+        ("2000000001", 60): {
+            "shared_tipo": "Tolva", "shared_placaTracto": "ABC-123",
+            "shared_placaPlataforma": "P1-001", "shared_tracker": "TRK-01",
+            "shared_conductor": "JUAN PEREZ", "shared_empresa": "Empresa A",
+        },
+    }
+
+    df_graficos, df_eventos = procesar_eventos(telemetria(eventos, shared))
+
+    assert df_graficos["NIA"].tolist() == ["2000000001"]
+    fila = df_graficos.iloc[0]
+
+    # Datos compartidos rellenados desde la Desasignación
+    assert fila["Tipo"] == "Tolva"
+    assert fila["Placa Tracto"] == "ABC-123"
+    assert fila["Placa Plataforma"] == "P1-001"
+    assert fila["Conductor"] == "JUAN PEREZ"
+    assert set(df_eventos["shared_tipo"]) == {"Tolva"}
+
+    # Primera / última Balanza y su ruta previa
+    assert fila["Ruta Balanza inicial"] == 5
+    assert fila["Balanza inicial"] == 5
+    assert fila["Calificación"] == 20
+    assert fila["Ruta Balanza final"] == 5
+    assert fila["Balanza final"] == 5
+
+    assert fila["Ingreso"] == pd.Timestamp("2023-11-14 17:13:20")
+    assert fila["Salida"] == pd.Timestamp("2023-11-14 18:13:20")
+    assert fila["T. Permanencia (h)"] == 1.0
+    # Balanza (intermedia 10) + inicial 5 + final 5 + Calificación 20 + rutas 5 + 5 = 50 min
+    assert fila["T. Descarga (h)"] == 0.83